@@ -1,9 +1,8 @@
-#!/usr/bin/env python
-# python 2.7
-from __future__ import print_function
-from numpy import linspace
-import c3d
+#!/usr/bin/env python3
+import numpy as np
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
 
 """
@@ -171,287 +170,148 @@ parser = argparse.ArgumentParser(
     description='Convert a TSV file to STO (text) format.')
 parser.add_argument('input', default='-', metavar='FILE',
                     nargs='+', help='process data from this input FILE')
-
-def pad(str_float_value):
-    """
-    Pad value with zeroes to 8 digits after dot
-    """
-    return "%.8f"%float(str_float_value)
-
-def reverse_axis(x_data):
-    """
-    Reverse axis
-    Axis = -Axis
-    """
-    if x_data[:1] == '-':
-        x_data = x_data[1:]
-    else:
-        x_data = '-'+x_data
-    return x_data
-
-def scale_axis(axis_data, factor):
+parser.add_argument('-v', '--verbose', action='store_true',
+                    help='print .mot header and skipped .tsv header fields')
+
+# .tsv data columns used for ground reaction data, looked up by title in Force_X titles row
+# moment(torque) columns are not read - we have to calculate it later according to https://www.c-motion.com/v3dwiki/index.php?title=FP_Type_6
+TSV_COLUMNS = ('Force_X', 'Force_Y', 'Force_Z', 'COP_X', 'COP_Y')
+
+# .mot data columns according to .mot documentation, time column in the begining
+MOT_COLUMNS = ('time',
+               'R_ground_force_vx', 'R_ground_force_vy', 'R_ground_force_vz',
+               'R_ground_force_px', 'R_ground_force_py', 'R_ground_force_pz',
+               'L_ground_force_vx', 'L_ground_force_vy', 'L_ground_force_vz',
+               'L_ground_force_px', 'L_ground_force_py', 'L_ground_force_pz',
+               'R_ground_torque_x', 'R_ground_torque_y', 'R_ground_torque_z',
+               'L_ground_torque_x', 'L_ground_torque_y', 'L_ground_torque_z')
+
+# Titles row and format of one data row: tab separated and space padded to 20 characters
+# (values to 8 digits after dot) for better look in text viewers
+COLUMNS_HEADER = '\t'.join([name.rjust(20) for name in MOT_COLUMNS])+'\n'
+ROW_FORMAT = '\t'.join(['%20.8f']*len(MOT_COLUMNS))+'\n'
+
+def parse_header(tsv_file, verbose=False):
     """
-    Scale axis data by factor
-    X (string) = factor * X 
+    Read TSV header lines up to Force_X data titles row
 
     Arguments:
-    axis_data = axis to scale
-    factor = scale factor (float)
-    """
-    scaled_axis = str(float(axis_data)*factor)
-    return scaled_axis
+    tsv_file = opened .tsv file, left positioned at the first data row
+    verbose = print extra header fields skipped from .tsv file
 
-def shift_axis(axis_data,shift_ammount):
+    Returns frame size (quant) and list of data column titles
+    """
+    quant = 0  # Start frame size in seconds
+    for i in tsv_file:
+        if i.startswith('FREQUENCY'):
+            # get frequency from FREQUENCY data field in TSV file
+            frequency = int(i.split()[1])
+            quant = 1.0 / frequency  # Calculate frame size in seconds
+
+        if i.startswith('Force_X'):
+            return quant, i.split()  # Header ended - the rest of file is data
+        # Still header then write additional data from .tsv
+        # f.write(i) # skip additional fields to be written from .tsv file, uncomment it if you want to write this data to .mot file, but check position in file!
+        # just output this additional data to console
+        if verbose:
+            print('EXTRA FIELD - NOT WRITTEN TO .mot FILE:', i)
+    raise ValueError(f'No Force_X data titles row in {tsv_file.name}')
+
+def transform(data, quant):
     """
-    Shift Axis origin
+    Convert QTM force plate data to .mot ground reaction rows
 
     Arguments:
-    axis_data = axis to shift
-    shift_amount = amount for shift
-    """
-    shifted_axis = pad(str(float(axis_data)+shift_ammount))
-    return shifted_axis
+    data = (n_rows, 5) array of .tsv TSV_COLUMNS - Force_X|Force_Y|Force_Z|COP_X|COP_Y
+    quant = frame size in seconds
 
-def convert(filename):
+    Returns (n_rows, 19) array: time and 18 GRF columns in .mot order,
+    right leg data in the first half of frames and left leg in the second
+    """
+    n_rows = len(data)
+    dataset_half = n_rows//2  # half of frames count to split legs force data
+
+    # one contiguous array per physical quantity - all axis transforms below are whole vector operations
+    Fx, Fy, Fz, Px, Py = np.ascontiguousarray(data.T)
+
+    # .mot columns are filled in place - COP Y, flying leg force and cop and all moments(torque) stay 0
+    out = np.zeros((len(MOT_COLUMNS), n_rows))
+
+    # add time column with uniformly spaced values in the begining of each row of data
+    # frame_number*quant for every frame at once - no accumulated error of summing quant frame by frame
+    out[0] = np.arange(n_rows)*quant
+
+    # QTM 2 OSIM Axis rotations in one expression per .mot column, written straight to each leg half:
+    # Vy, Vz taken from Force Z, Y and Px, Pz from COP Y, X (COP scaled from millimeters, COP Y stays 0),
+    # Vz, Px and Pz reversed, Vx and Px shifted by -0.5, Vz and Pz by 0.25
+
+    # RIGHT LEG DATA - first half of frames
+    right = slice(None, dataset_half)
+    out[1, right] = Fx[right]-0.5 # right foot force Vx
+    out[2, right] = Fz[right] # right foot force Vy
+    out[3, right] = 0.25-Fy[right] # right foot force Vz
+    out[4, right] = Py[right]*0.001-0.5 # right foot cop Px
+    out[6, right] = 0.25-Px[right]*0.001 # right foot cop Pz
+
+    # LEFT LEG DATA - second half of frames
+    left = slice(dataset_half, None)
+    out[7, left] = Fx[left]-0.5 # left foot force Vx
+    out[8, left] = Fz[left] # left foot force Vy
+    out[9, left] = 0.25-Fy[left] # left foot force Vz
+    out[10, left] = Py[left]*0.001-0.5 # left foot cop Px
+    out[12, left] = 0.25-Px[left]*0.001 # left foot cop Pz
+
+    return out.T
+
+def convert(filename, verbose=False):
     if filename != '-':
         # input = open(filename, 'r')
         # output = open(filename.replace('.tsv', '.sto'), 'w')
         pass
-    # Read TSV file and store in line_data list
-    line_data = []
-    with open(filename, 'r') as f:
-        for line in f:
-            # read data rows from file and pack it into line_data list object
-            line_data.append(line)
-
-    with open(filename.replace('.tsv', '.mot'), 'w') as f:
-        f.write(filename.replace('.tsv', '.mot')+'\n')
-        print (filename.replace('.tsv', '.mot'))
-        f.write('version=1'+'\n')
-        print ('version=1')
-        # code to calculate Rows and Columns count of data field
-        header_rows = 0  # Start number of rows
-        time = 0.0  # Start time
-        # quant = []  # array of uniformly spaced time values in case of wikipedia definition 0..1
-        quant = 0  # Start frame size in milliseconds
-        data_flag = False # Marker of header end
-        frame_number = 0 # Start frame number
-        zero_tuple = '0.00000000', '0.00000000', '0.00000000'  # zero values for flying leg
-
-        #lambda for space padding goes here
-
-        for i in line_data:
-            header_rows += 1
-
-            if i[:9] == 'FREQUENCY':
-                # get frequency from FREQUENCY data field in TSV file
-                frequency = int(i.split()[1])
-                quant = 1.0 / frequency  # Calculate frame size in milliseconds 
-                # recalculated later by uniformly spaced values method for time column if we use wikipedia definition 0..1
-           
-            if i[:7] == 'Force_X':
-                # Count columns in data part plus 1 time column
-                # Added right number of columns with left leg and time data
-                n_columns = len(i.split())+1+9
-                n_columns_str = 'nColumns='+str(n_columns)+'\n'
-                total_rows = sum(1 for line in open(filename))
-                n_rows = total_rows - header_rows
-                n_rows_str = 'nRows='+str(n_rows)+'\n'
-                
-                dataset_half = n_rows/2  # counter for half of frames count to split legs force data
-
-                # make time column uniformly spaced 0..1 quant now array of such values
-                # quant = linspace(0, 1, n_rows) - wrongly defined and means just splitting by the same values
-
-                f.write(n_rows_str)
-                print(n_rows_str)
-                f.write(n_columns_str)
-                print(n_columns_str)
-                mot_column_header = "\t".join("   R_ground_force_vx,    R_ground_force_vy,    R_ground_force_vz,    R_ground_force_px,    R_ground_force_py,    R_ground_force_pz,    L_ground_force_vx,    L_ground_force_vy,    L_ground_force_vz,    L_ground_force_px,    L_ground_force_py,    L_ground_force_pz,    R_ground_torque_x,    R_ground_torque_y,    R_ground_torque_z,    L_ground_torque_x,    L_ground_torque_y,    L_ground_torque_z".split(', '))
-                # new header according to .mot documentation and add time column in the begining of data part of file
-                i = 'time\t'.rjust(21)+mot_column_header+'\n'
-                f.write('inDegrees=yes'+'\n')
-                # this indicates, that all values are in degrees for angles, bot it is optional for forces only data files
-                print('inDegrees=yes')
-                f.write('endheader'+'\n')
-                print('endheader')  # header end sign
-                f.write(i)
-                print (i) # Debug header titles
-                data_flag = True
-                continue
-            if not data_flag:  # Check if it is still header then write additional data from .tsv
-                # f.write(i) # skip additional fields to be written from .tsv file, uncomment it if you want to write this data to .mot file, but check position in file!
-                # just output this additional data to console
-                print ('EXTRA FIELD - NOT WRITTEN TO .mot FILE:', i)
-            else:  # Header ended - add time data column to the each row of data
-
-                # Get Force_X|Force_Y|Force_Z|Moment_X|Moment_Y|Moment_Z|COP_X|COP_Y|COP_Z from .tsv file - right foot first half of file cut
-                data_string_split = i.split()
-
-                # print (data_string_split) # debug output of .tsv data fields order.
-
-                data_string_split[0] = pad(data_string_split[0]) # Force Vx
-                data_string_split[3] = pad(data_string_split[3]) # Moment Mx
-                data_string_split[6] = pad(scale_axis(data_string_split[6], 0.001)) # COP Px with no reverse scaled
-
-                # Swap Y and Z for force, moment and cop for QTM 2 OSIM Axis rotations
-
-                data_string_split[1], data_string_split[2] = pad(data_string_split[2]), pad(data_string_split[1]) # Force Y,Z to Z,Y
-                data_string_split[4], data_string_split[5] = pad(data_string_split[5]), pad(data_string_split[4]) # Moment Y,Z to Z,Y
-                data_string_split[7], data_string_split[8] = '0.00000000', pad(scale_axis(reverse_axis(data_string_split[7]), 0.001)) # 0.000000 for COP Y and reverse scaled COP Z
-                # cop Y,Z to Z,Y
-                
-                data_string_split[2], data_string_split[0] = data_string_split[2], data_string_split[0] # Vz - Vz
-                data_string_split[5], data_string_split[3] = data_string_split[3], data_string_split[5] # Mz - Mz
-                data_string_split[8], data_string_split[6] = data_string_split[6], data_string_split[8] # Px - Pz
-
-                # Reverse Axis
-
-                #data_string_split[0] = reverse_axis(data_string_split[0]) # reverse Vx
-                data_string_split[3] = reverse_axis(data_string_split[3]) # reverse Mx
-                data_string_split[6] = reverse_axis(data_string_split[6]) # reverse Px
-
-                data_string_split[2] = reverse_axis(data_string_split[2]) # reverse Vz
-                data_string_split[5] = reverse_axis(data_string_split[5]) # reverse Mz
-                data_string_split[8] = reverse_axis(data_string_split[8]) # reverse Pz
-                
-                # Shift Axis
-
-                data_string_split[0] = shift_axis(data_string_split[0],-0.5) # shift Vx
-                data_string_split[3] = shift_axis(data_string_split[3],-0.5) # shift Mx
-                data_string_split[6] = shift_axis(data_string_split[6],-0.5) # shift Px
-                
-                data_string_split[2] = shift_axis(data_string_split[2],0.25) # shift Vz
-                data_string_split[5] = shift_axis(data_string_split[5],0.25) # shift Mz
-                data_string_split[8] = shift_axis(data_string_split[8],0.25) # shift Pz
-                
-                """# swap moment(torque) and cop(p) from .tsv order to .mot order of columns
-                    
-                # Moment(torque) - we have to calculate it later according to https://www.c-motion.com/v3dwiki/index.php?title=FP_Type_6
-                # swap_tuple_m = data_string_split[3], data_string_split[4], data_string_split[5]
-                # We have to calculate Tz moment as defined above
-
-                # cop
-                swap_tuple_p = data_string_split[6], data_string_split[7], data_string_split[8]
-
-                # cop
-                data_string_split[3], data_string_split[4], data_string_split[5] = swap_tuple_p
-
-                # cop zero debug
-                # data_string_split[4] = '0'
-
-                # left leg force = 0
-                data_string_split[6], data_string_split[7], data_string_split[8] = zero_tuple
-
-                data_string_split.extend(zero_tuple)  # left leg cop = 0
-
-                #data_string_split.extend(swap_tuple_m)  # moment(torque) # we will calculate Tz rotation moment later
-                data_string_split.extend(zero_tuple)  # moment(torque) = 0 - 0 - 0 padding with zeros for now
-                # left leg moment(torque) = 0
-                data_string_split.extend(zero_tuple)
-                """
-
-                if frame_number < dataset_half:  # RIGHT LEG DATA
-
-                    # swap moment(torque) and cop(p) from .tsv order to .mot order of columns
-                    
-                    # moment(torque) - we have to calculate it later according to https://www.c-motion.com/v3dwiki/index.php?title=FP_Type_6
-                    # swap_tuple_m = data_string_split[3], data_string_split[4], data_string_split[5]
-                    # We have to calculate Tz moment as defined above
-
-                    # cop
-                    swap_tuple_p = data_string_split[6], data_string_split[7], data_string_split[8]
-
-                    # cop
-                    data_string_split[3], data_string_split[4], data_string_split[5] = swap_tuple_p
-
-                    # cop zero debug
-                    # data_string_split[4] = '0'
-
-                    # left leg force = 0
-                    data_string_split[6], data_string_split[7], data_string_split[8] = zero_tuple
-
-                    data_string_split.extend(zero_tuple)  # left leg cop = 0
-
-                    #data_string_split.extend(swap_tuple_m)  # moment(torque) # we will calculate Tz rotation moment later
-                    data_string_split.extend(zero_tuple)  # moment(torque) = 0 - 0 - 0 padding with zeros for now
-                    # left leg moment(torque) = 0
-                    data_string_split.extend(zero_tuple)
-
-                else:  # LEFT LEG DATA
-
-                    # print (data_string_split) # debug output of .tsv data fields order.
-
-                    swap_tuple_f = data_string_split[0], data_string_split[1], data_string_split[2]
-                    # swap_tuple_m = data_string_split[3], data_string_split[4], data_string_split[5] # unused since we have to calculate Tz moment later
-                    swap_tuple_cop = data_string_split[6], data_string_split[7], data_string_split[8]
-
-                    # right foot force - zero
-                    data_string_split[0], data_string_split[1], data_string_split[2] = zero_tuple
-                    # right foot cop - zero
-                    data_string_split[3], data_string_split[4], data_string_split[5] = zero_tuple
-
-                    # left foot force
-                    data_string_split[6], data_string_split[7], data_string_split[8] = swap_tuple_f
-
-                    data_string_split.extend(swap_tuple_cop)  # left foot cop
-
-                    # right foot moment - zero
-                    data_string_split.extend(zero_tuple)
-
-                    # data_string_split.extend(swap_tuple_m)  # left foot moment # we will calculate Tz rotation moment later
-                    data_string_split.extend(zero_tuple) # moment(torque) = 0 - 0 - 0 padding with zeros for now
-
-                # create tab separated and space padded row of GRF values space padded for better look in text viewers
-                splt = ''
-                result = ''
-                final_result = ''
-                for i in data_string_split:
-                    # print (i)
-                    splt = i.split('.')
-                    for x in splt:
-                        if x[:1] == '-':
-                            x = x[0:]
-                            if len(result) <1:
-                                result = result+x.rjust(11)
-                            else:
-                                result = '-'+result+'.'+x
-                        elif len(result) <1:
-                            result = result+x.rjust(11)
-                        else:
-                            result = result+'.'+x
-                    
-                    final_result = final_result+result+'\t'
-                    
-                    result = ''
-                    
-
-                #i = ''.rjust(10)+'\t'.ljust(11).join(data_string_split) # add sapaces in front and behind values for better view in text format
-                i = final_result.rstrip('\t')
-
-                # print (i) # debug
-                data_row_str = pad(str(time)).rjust(20)+'\t'+i+'\n'
-                f.write(data_row_str)
-                # print (data_row_str) # Debug output disable
-
-                frame_number += 1
-                time = time + quant # adds unform space calculated in quant variable
-
-                """
-                # pick uniformly spaced value from precalculated array of such values for given frame number
-                # next frame
-                if frame_number == n_rows: # check if it is a last frame to prevent index out of range in unformly spaced values array quant[]
-                    break
-                else:
-                    time = quant[frame_number]
-                """
-
-        print (filename.replace('.tsv', '.mot'),' Done!')
+    # Read TSV file in a single pass - header lines up to Force_X titles row, then data block
+    with open(filename, 'r') as fin:
+        quant, titles = parse_header(fin, verbose)
+        # .tsv column index by title instead of fixed Force|Moment|COP positions
+        col_idx = {name: k for k, name in enumerate(titles)}
+        missing = [name for name in TSV_COLUMNS if name not in col_idx]
+        if missing:
+            raise ValueError(f"No {', '.join(missing)} data columns in {filename}")
+
+        # Get Force_X|Force_Y|Force_Z|COP_X|COP_Y from the rest of .tsv file as (n_rows, 5) array,
+        # parsed straight from the file without keeping its lines in memory, other columns are skipped
+        data = np.loadtxt(fin, usecols=[col_idx[name] for name in TSV_COLUMNS], ndmin=2)
+
+    n_rows = len(data)
+    mot_data = transform(data, quant)
+
+    # large output buffer - header lines and data block go to disk in a few big writes
+    with open(filename.replace('.tsv', '.mot'), 'w', buffering=1<<20) as f:
+        header = [filename.replace('.tsv', '.mot'),
+                  'version=1',
+                  f'nRows={n_rows}',
+                  f'nColumns={len(MOT_COLUMNS)}',
+                  # this indicates, that all values are in degrees for angles, bot it is optional for forces only data files
+                  'inDegrees=yes',
+                  'endheader']  # header end sign
+        f.write('\n'.join(header)+'\n')
+        # new header according to .mot documentation and add time column in the begining of data part of file
+        f.write(COLUMNS_HEADER)
+        if verbose:
+            # Debug output of .mot header and titles
+            print('\n'.join(header))
+            print(COLUMNS_HEADER)
+
+        # one format operation per row on plain floats, whole data block written at once
+        rows = [ROW_FORMAT % tuple(row) for row in mot_data.tolist()]
+        f.write(''.join(rows))
+
+        print(filename.replace('.tsv', '.mot'),' Done!')
 
 
 def main(args):
-    for filename in args.input:
-        convert(filename)
+    # input files are independent - convert them in parallel worker processes
+    with ProcessPoolExecutor() as executor:
+        list(executor.map(partial(convert, verbose=args.verbose), args.input))
 
 
 if __name__ == '__main__':